@@ -1,17 +1,84 @@
+# 性能说明：本插件的耗时集中在 aiohttp 网络请求和 f-string 文本拼接上，
+# 不适合用 Numba 等 JIT 加速——字符串/字典处理只会落入 object mode，
+# 编译开销无法回本（参见 numba/numba#2585）。优化请优先考虑会话复用、
+# LRU 缓存和相同查询合并。
+import asyncio
 import aiohttp
 import logging
+import sys
+import time
+from collections import OrderedDict
 from typing import Optional, Dict, List
 from astrbot.api.all import AstrMessageEvent, CommandResult, Context, Plain
 import astrbot.api.event.filter as filter
 from astrbot.api.star import register, Star
 
+try:
+    import orjson as _json
+except ImportError:  # orjson 为可选依赖，缺失时回退到标准库
+    import json as _json
+
+try:
+    import ijson
+except ImportError:  # ijson 为可选依赖，缺失时完整解析响应
+    ijson = None
+
 logger = logging.getLogger("astrbot")
 
-SEAT_EMOJI = {
+SEAT_EMOJI = {sys.intern(k): v for k, v in {
     '硬座': '💺', '软座': '🪑', '硬卧': '🛏️',
     '软卧': '🛌', '无座': '🚶', '商务座': '💎',
     '一等座': '💺', '二等座': '🪑'
-}
+}.items()}
+
+STATUS_EMOJI = {'充足': '✅', '紧张': '⚠️'}
+
+CACHE_MAX = 1024      # 最多保留的用户会话数
+SESSION_TTL = 600.0   # 用户会话有效期（秒）
+STREAM_MIN_BYTES = 1 << 20  # 响应体超过此大小且装有 ijson 时才流式解析
+
+_CHOICE_SET = frozenset("12345678")
+
+def _seat_status(status: str) -> str:
+    """余票状态转图标"""
+    # 上游多直接返回"充足"/"紧张"，精确命中可省去子串扫描
+    emoji = STATUS_EMOJI.get(status)
+    if emoji is not None:
+        return emoji
+    for key, value in STATUS_EMOJI.items():
+        if key in status:
+            return value
+    return '❌'
+
+def _intern_seat_names(train: Dict) -> None:
+    """驻留座位名，详情渲染时查 SEAT_EMOJI 可走同一对象的快速路径"""
+    for seat in train.get('seats', ()):
+        name = seat.get('name')
+        if type(name) is str:
+            seat['name'] = sys.intern(name)
+
+async def _parse_stream(content) -> Dict:
+    """流式解析响应，只构建前8个车次
+
+    逐个事件解析比整体解析慢一个数量级，只用于超大响应以压低内存峰值。
+    响应体会读到末尾，以便连接归还连接池复用；缺少 code 时按失败处理。
+    """
+    code = None
+    trains = []
+    builder = None
+    async for prefix, event, value in ijson.parse_async(content, use_float=True):
+        if prefix == "code":
+            code = value
+        elif builder is not None:
+            builder.event(event, value)
+            if prefix == "data.item" and event == "end_map":
+                _intern_seat_names(builder.value)
+                trains.append(builder.value)
+                builder = None
+        elif prefix == "data.item" and event == "start_map" and len(trains) < 8:
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+    return {"code": code, "data": trains}
 
 @register("train_ticket", "作者名", "智能火车票查询插件", "1.2.0")
 class TrainTicketPlugin(Star):
@@ -19,55 +86,128 @@ class TrainTicketPlugin(Star):
         super().__init__(context)
         self.api_url = "https://api.lolimi.cn/API/hc/api.php"
         self.timeout = aiohttp.ClientTimeout(total=15)
-        self.cache = {}  # 用户会话缓存
+        self.request_timeout = 10  # 等待响应头的超时（秒），读取响应体仍受 total 限制
+        self.cache: OrderedDict = OrderedDict()  # 用户会话缓存 user_id -> (时间戳, 车次列表)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_lock = asyncio.Lock()
+        self._query_cache: OrderedDict = OrderedDict()  # 查询结果缓存 key -> (时间戳, 结果)
+        self._cache_max = 512
+        self._cache_ttl = 30.0
+        self._inflight: Dict[tuple, asyncio.Future] = {}  # 进行中的相同查询
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """获取复用的HTTP会话（懒加载）"""
+        if self._session is None or self._session.closed:
+            async with self._session_lock:
+                if self._session is None or self._session.closed:
+                    connector = aiohttp.TCPConnector(
+                        limit_per_host=64,
+                        ttl_dns_cache=300,
+                        keepalive_timeout=60
+                    )
+                    self._session = aiohttp.ClientSession(
+                        timeout=self.timeout, connector=connector
+                    )
+        return self._session
 
     async def _fetch_tickets(self, params: Dict) -> Optional[Dict]:
+        """查询票务（带LRU+TTL缓存）"""
+        key = (params["departure"], params["arrival"], params["date"], params["form"])
+        entry = self._query_cache.get(key)
+        if entry is not None and time.monotonic() - entry[0] < self._cache_ttl:
+            self._query_cache.move_to_end(key)
+            return entry[1]
+
+        # 相同查询正在进行时直接等待其结果
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # 发起查询的一方被取消，由等待者重新发起
+                return await self._fetch_tickets(params)
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            result = await self._request_tickets(params)
+            if result and result.get("code") == "200":
+                self._query_cache[key] = (time.monotonic(), result)
+                self._query_cache.move_to_end(key)
+                while len(self._query_cache) > self._cache_max:
+                    self._query_cache.popitem(last=False)
+        except BaseException:
+            fut.cancel()
+            raise
+        else:
+            fut.set_result(result)
+        finally:
+            del self._inflight[key]
+        return result
+
+    async def _request_tickets(self, params: Dict) -> Optional[Dict]:
         """执行API请求"""
         try:
-            async with aiohttp.ClientSession(timeout=self.timeout) as session:
-                async with session.get(self.api_url, params=params) as resp:
-                    if resp.status != 200:
-                        logger.error(f"API请求失败 HTTP {resp.status}")
-                        return None
-                    return await resp.json()
+            session = await self._get_session()
+            resp = await asyncio.wait_for(
+                session.get(self.api_url, params=params), timeout=self.request_timeout
+            )
+            try:
+                if resp.status != 200:
+                    logger.error("API请求失败 HTTP %s", resp.status)
+                    return None
+                if ijson is not None and (resp.content_length or 0) > STREAM_MIN_BYTES:
+                    return await _parse_stream(resp.content)
+                result = _json.loads(await resp.read())
+                if isinstance(result, dict) and result.get("data"):
+                    # 只保留可供选择的前8个车次，查询缓存和用户会话都不再持有其余车次
+                    result["data"] = result["data"][:8]
+                    for train in result["data"]:
+                        _intern_seat_names(train)
+                return result
+            finally:
+                resp.release()
         except Exception as e:
-            logger.error(f"票务查询异常: {str(e)}", exc_info=True)
+            logger.error("票务查询异常: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
             return None
 
-    def _build_list_msg(self, trains: List) -> List[str]:
+    def _build_list_msg(self, trains: List) -> str:
         """生成车次列表消息"""
-        msg = ["🚄 找到以下车次（回复编号查看详情）："]
-        for idx, train in enumerate(trains[:8], 1):
-            msg.append(
-                f"{idx}. {train['TrainNumber']} "
-                f"{train['DepartTime']}→{train['DestTime']} "
-                f"({train['TotalTime']})"
-            )
-        return msg
+        return "\n".join(["🚄 找到以下车次（回复编号查看详情）："] + [
+            f"{idx}. {train['TrainNumber']} "
+            f"{train['DepartTime']}→{train['DestTime']} "
+            f"({train['TotalTime']})"
+            for idx, train in enumerate(trains, 1)
+        ])
 
     def _build_detail_msg(self, train: Dict) -> str:
         """生成车次详情消息"""
-        msg = [
-            f"🚂 车次：{train['TrainNumber']} ({train['TrainType']})",
-            f"⏰ 时间：{train['DepartTime']} → {train['DestTime']}",
-            f"⏳ 历时：{train['TotalTime']}",
-            f"📍 车站：{train['Depart']} → {train['Dest']}",
+        header = (
+            f"🚂 车次：{train['TrainNumber']} ({train['TrainType']})\n"
+            f"⏰ 时间：{train['DepartTime']} → {train['DestTime']}\n"
+            f"⏳ 历时：{train['TotalTime']}\n"
+            f"📍 车站：{train['Depart']} → {train['Dest']}\n"
             "\n🎟️ 票务信息："
+        )
+
+        seat_emoji_get = SEAT_EMOJI.get
+        seat_status = _seat_status
+        seat_lines = [
+            f"{seat_emoji_get(s['name'], '🎫')} {s['name']}: {seat_status(s['status'])} ￥{s['price']}"
+            for s in train.get('seats', ())
         ]
-        
-        for seat in train.get('seats', []):
-            emoji = SEAT_EMOJI.get(seat['name'], '🎫')
-            status = "✅" if "充足" in seat['status'] else "⚠️" if "紧张" in seat['status'] else "❌"
-            msg.append(f"{emoji} {seat['name']}: {status} ￥{seat['price']}")
-        
-        return "\n".join(msg)
+        if not seat_lines:
+            return header
+        return header + "\n" + "\n".join(seat_lines)
 
     @filter.command("火车票")
     async def ticket_query(self, event: AstrMessageEvent):
         '''火车票查询：/火车票 出发地 目的地 [日期=今天] [类型=高铁]'''
         try:
-            args = event.message_str.split()
-            
+            args = event.message_str.split(None, 5)  # 最多用到前5段，其余留在末段不再切分
+
             # 参数验证
             if len(args) < 3:
                 yield CommandResult().error(
@@ -79,10 +219,10 @@ class TrainTicketPlugin(Star):
 
             # 解析参数
             params = {
-                "departure": args,
-                "arrival": args,
-                "date": args if len(args)>=4 else "",
-                "form": args if len(args)>=5 else "高铁",
+                "departure": args[1],
+                "arrival": args[2],
+                "date": args[3] if len(args)>=4 else "",
+                "form": args[4] if len(args)>=5 else "高铁",
                 "type": "json"
             }
 
@@ -100,33 +240,53 @@ class TrainTicketPlugin(Star):
                 yield CommandResult().message("🤷 没有找到符合条件的列车呢～")
                 return
 
-            # 缓存数据并发送列表
-            self.cache[event.user_id] = trains
-            list_msg = self._build_list_msg(trains)
-            yield CommandResult().message("\n".join(list_msg))
-            yield CommandResult().message("💡 请回复编号查看详情（输入1-8）：")
+            # 缓存可选车次并发送列表
+            top = trains[:8]
+            self.cache[event.user_id] = (time.monotonic(), top)
+            self.cache.move_to_end(event.user_id)
+            while len(self.cache) > CACHE_MAX:
+                self.cache.popitem(last=False)
+            yield CommandResult().message(
+                self._build_list_msg(top) + "\n💡 请回复编号查看详情（输入1-8）："
+            )
 
         except Exception as e:
-            logger.error(f"车次查询异常: {str(e)}", exc_info=True)
+            logger.error("车次查询异常: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
             yield CommandResult().error("💥 票务查询服务暂时不可用")
 
     @filter.regex(r"^[1-8]$")
     async def handle_choice(self, event: AstrMessageEvent):
         """处理车次选择"""
-        try:
-            if event.user_id not in self.cache:
-                yield CommandResult().error("⏳ 会话已过期，请重新查询")
-                return
+        s = event.message_str
+        if len(s) != 1:
+            s = s.strip()
+        if s not in _CHOICE_SET:
+            return
 
-            choice = int(event.message_str.strip())
-            trains = self.cache[event.user_id]
+        entry = self.cache.get(event.user_id)
+        if entry is None or time.monotonic() - entry[0] >= SESSION_TTL:
+            self.cache.pop(event.user_id, None)
+            yield CommandResult().error("⏳ 会话已过期，请重新查询")
+            return
+        self.cache.move_to_end(event.user_id)
 
-            if 1 <= choice <= len(trains):
-                detail_msg = self._build_detail_msg(trains[choice-1])
-                yield CommandResult().message(detail_msg)
-            else:
-                yield CommandResult().error("⚠️ 请输入有效编号哦～")
+        choice = ord(s) - 48
+        trains = entry[1]
+        if choice > len(trains):
+            yield CommandResult().error("⚠️ 请输入有效编号哦～")
+            return
 
+        # 上游数据字段缺失时才会出错
+        try:
+            detail_msg = self._build_detail_msg(trains[choice-1])
         except Exception as e:
-            logger.error(f"详情查询异常: {str(e)}", exc_info=True)
+            logger.error("详情查询异常: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
             yield CommandResult().error("💥 详情查询失败")
+            return
+        yield CommandResult().message(detail_msg)
+
+    async def terminate(self):
+        """插件卸载时关闭HTTP会话"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
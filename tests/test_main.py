@@ -0,0 +1,221 @@
+import asyncio
+import json
+import unittest
+
+try:
+    import main
+except ImportError as e:  # 需要 astrbot 和 aiohttp
+    raise unittest.SkipTest(f"缺少依赖: {e}")
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+class _Content:
+    """模拟 aiohttp 的 StreamReader，分块返回响应体"""
+
+    def __init__(self, body: bytes, chunk: int = 16) -> None:
+        self.body = body
+        self.chunk = chunk
+        self.pos = 0
+
+    async def read(self, n: int = -1) -> bytes:
+        size = self.chunk if n < 0 else min(n, self.chunk)
+        data = self.body[self.pos:self.pos + size]
+        self.pos += len(data)
+        return data
+
+
+def _train(i: int) -> dict:
+    return {
+        "TrainNumber": f"G{i}", "TrainType": "高铁",
+        "DepartTime": "08:00", "DestTime": "12:00", "TotalTime": "4h",
+        "Depart": "北京", "Dest": "上海",
+        "seats": [{"name": "二等座", "status": "充足", "price": 553.5}],
+    }
+
+
+def _parse(body: bytes):
+    content = _Content(body)
+    result = asyncio.run(main._parse_stream(content))
+    return result, content
+
+
+def _params(departure: str = "北京") -> dict:
+    return {"departure": departure, "arrival": "上海", "date": "", "form": "高铁", "type": "json"}
+
+
+class _Plugin(main.TrainTicketPlugin):
+    """用预设结果代替真实请求，并记录请求次数"""
+
+    def __init__(self, result=None, delay: float = 0) -> None:
+        super().__init__(None)
+        self.result = {"code": "200", "data": [_train(0)]} if result is None else result
+        self.delay = delay
+        self.calls = 0
+
+    async def _request_tickets(self, params):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self.result
+
+
+class _Response:
+    def __init__(self, body: bytes, content_length: int) -> None:
+        self.status = 200
+        self.content_length = content_length
+        self.content = _Content(body)
+        self.body = body
+
+    async def read(self) -> bytes:
+        return self.body
+
+    def release(self) -> None:
+        pass
+
+
+class _Session:
+    def __init__(self, resp: _Response) -> None:
+        self.resp = resp
+
+    async def get(self, url, params=None):
+        return self.resp
+
+
+class RequestTicketsTest(unittest.IsolatedAsyncioTestCase):
+    body = json.dumps({"code": "200", "data": [_train(i) for i in range(12)]}).encode()
+
+    async def _request(self, content_length: int):
+        plugin = main.TrainTicketPlugin(None)
+        resp = _Response(self.body, content_length)
+
+        async def get_session():
+            return _Session(resp)
+
+        plugin._get_session = get_session
+        return await plugin._request_tickets(_params()), resp
+
+    async def test_small_body_decoded_whole(self):
+        result, resp = await self._request(len(self.body))
+        self.assertEqual(resp.content.pos, 0)
+        self.assertEqual(result["code"], "200")
+        self.assertEqual([t["TrainNumber"] for t in result["data"]], [f"G{i}" for i in range(8)])
+        name = result["data"][0]["seats"][0]["name"]
+        self.assertIs(name, next(k for k in main.SEAT_EMOJI if k == "二等座"))
+
+    @unittest.skipIf(ijson is None, "未安装 ijson")
+    async def test_large_body_streamed_with_same_shape(self):
+        whole, _ = await self._request(len(self.body))
+        streamed, resp = await self._request(main.STREAM_MIN_BYTES + 1)
+        self.assertEqual(resp.content.pos, len(self.body))
+        self.assertEqual(streamed, whole)
+
+
+class QueryCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def test_hit_within_ttl(self):
+        plugin = _Plugin()
+        first = await plugin._fetch_tickets(_params())
+        second = await plugin._fetch_tickets(_params())
+        self.assertIs(first, second)
+        self.assertEqual(plugin.calls, 1)
+
+    async def test_expired_entry_refetched(self):
+        plugin = _Plugin()
+        await plugin._fetch_tickets(_params())
+        key, (ts, result) = next(iter(plugin._query_cache.items()))
+        plugin._query_cache[key] = (ts - plugin._cache_ttl, result)
+        await plugin._fetch_tickets(_params())
+        self.assertEqual(plugin.calls, 2)
+
+    async def test_lru_eviction(self):
+        plugin = _Plugin()
+        plugin._cache_max = 2
+        await plugin._fetch_tickets(_params("北京"))
+        await plugin._fetch_tickets(_params("天津"))
+        await plugin._fetch_tickets(_params("北京"))  # 命中后变为最近使用
+        await plugin._fetch_tickets(_params("南京"))
+        self.assertEqual([k[0] for k in plugin._query_cache], ["北京", "南京"])
+        self.assertEqual(plugin.calls, 3)
+
+    async def test_failed_result_not_cached(self):
+        for result in ({"code": "500", "data": []}, {}):
+            plugin = _Plugin(result)
+            await plugin._fetch_tickets(_params())
+            await plugin._fetch_tickets(_params())
+            self.assertEqual(plugin.calls, 2)
+            self.assertFalse(plugin._query_cache)
+
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_calls_share_one_request(self):
+        plugin = _Plugin(delay=0.01)
+        results = await asyncio.gather(*(plugin._fetch_tickets(_params()) for _ in range(5)))
+        self.assertEqual(plugin.calls, 1)
+        self.assertTrue(all(r is results[0] for r in results))
+        self.assertEqual(plugin._inflight, {})
+
+    async def test_cancelled_follower_does_not_affect_others(self):
+        plugin = _Plugin(delay=0.01)
+        leader = asyncio.create_task(plugin._fetch_tickets(_params()))
+        follower = asyncio.create_task(plugin._fetch_tickets(_params()))
+        other = asyncio.create_task(plugin._fetch_tickets(_params()))
+        await asyncio.sleep(0)
+        follower.cancel()
+        self.assertIs(await leader, plugin.result)
+        self.assertIs(await other, plugin.result)
+        self.assertTrue(follower.cancelled())
+        self.assertEqual(plugin.calls, 1)
+        self.assertEqual(plugin._inflight, {})
+
+    async def test_cancelled_leader_reissued_by_followers(self):
+        plugin = _Plugin(delay=0.01)
+        leader = asyncio.create_task(plugin._fetch_tickets(_params()))
+        followers = [asyncio.create_task(plugin._fetch_tickets(_params())) for _ in range(2)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        self.assertTrue(leader.cancelled())
+        self.assertEqual(results, [plugin.result, plugin.result])
+        self.assertEqual(plugin.calls, 2)
+        self.assertEqual(plugin._inflight, {})
+
+
+@unittest.skipIf(ijson is None, "未安装 ijson")
+class ParseStreamTest(unittest.TestCase):
+    def test_code_before_data(self):
+        body = json.dumps({"code": "200", "data": [_train(i) for i in range(12)]}).encode()
+        result, content = _parse(body)
+        self.assertEqual(result["code"], "200")
+        self.assertEqual([t["TrainNumber"] for t in result["data"]], [f"G{i}" for i in range(8)])
+        self.assertEqual(result["data"][0], _train(0))
+        self.assertEqual(content.pos, len(body))
+        name = result["data"][0]["seats"][0]["name"]
+        self.assertIs(name, next(k for k in main.SEAT_EMOJI if k == "二等座"))
+
+    def test_code_after_data(self):
+        body = json.dumps({"data": [_train(i) for i in range(12)], "code": "500"}).encode()
+        result, content = _parse(body)
+        self.assertEqual(result["code"], "500")
+        self.assertEqual(len(result["data"]), 8)
+        self.assertEqual(content.pos, len(body))
+
+    def test_missing_code(self):
+        body = json.dumps({"data": [_train(i) for i in range(3)]}).encode()
+        result, _ = _parse(body)
+        self.assertIsNone(result["code"])
+
+    def test_fewer_than_eight_trains(self):
+        body = json.dumps({"code": "200", "data": [_train(i) for i in range(3)]}).encode()
+        result, _ = _parse(body)
+        self.assertEqual([t["TrainNumber"] for t in result["data"]], ["G0", "G1", "G2"])
+
+    def test_non_json_body(self):
+        with self.assertRaises(ijson.JSONError):
+            _parse(b"<html>502 Bad Gateway</html>")
+
+
+if __name__ == "__main__":
+    unittest.main()